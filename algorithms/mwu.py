@@ -0,0 +1,277 @@
+import math
+
+import numpy as np
+import numpy.typing as npt
+from tqdm import trange
+
+from datastructures.WeightedTree import WeightedTree
+import algorithms.utils as algsU
+
+
+def mwu_update_weights(h : npt.NDArray[np.float64], counts : npt.NDArray, scaled_eps : float, mu : float, scratch=None) -> None:
+    """
+    Applies one multiplicative weight update to h in place and re-normalizes it
+        h_i *= 1 - (eps / 4) * (1 - c_i) / mu
+    The constants are folded together so h is only touched by a couple of in-place passes
+
+    :param h: the weight vector (modified in place)
+    :param counts: per-point count of selected points within range (same length as h)
+    :param scaled_eps: the scaled MWU epsilon
+    :param mu: the error scale (k - 1)
+    :param scratch: optional preallocated array shaped like h to hold the update factors
+    :return: None
+    """
+    a = (scaled_eps * 0.25) / mu
+
+    # 1 - a * (1 - c) == (1 - a) + a * c
+    factor = np.multiply(counts, a, out=scratch, dtype=h.dtype)
+    factor += 1.0 - a
+
+    h *= factor
+    h *= 1.0 / h.sum()
+
+
+def build_color_groups(colors, kis):
+    """
+    Finds the indices of every color in kis once, so the MWU loop doesn't rescan colors every iteration
+
+    :param colors: an array of every color of the points in the dataset
+    :param kis: map of colors to requested counts
+    :return: a list of index arrays (one per color) and a matching list of k_i's
+    """
+    # fix the color order once so both lists line up
+    color_list = list(kis.keys())
+    ki_list = [kis[c] for c in color_list]
+    color_idx_list = [np.flatnonzero(colors == c) for c in color_list]
+
+    for idx, ki in zip(color_idx_list, ki_list):
+        assert len(idx) >= ki, "a color has fewer points than requested"
+
+    return color_idx_list, ki_list
+
+
+def min_weight_per_color(w_sums, color_idx_list, ki_list):
+    """
+    Finds the k_i lowest weight points of every color
+    Each color gets a single selection pass with its own kth, so every call reads each weight exactly once
+
+    :param w_sums: per-point weights
+    :param color_idx_list: per-color index arrays from build_color_groups
+    :param ki_list: per-color counts from build_color_groups
+    :return: the indices of the chosen points (grouped by color) and the sum of their weights
+    """
+    w_sums = np.ravel(w_sums)
+
+    min_indecies = []
+    W = 0.0
+    for color_sums_ind, ki in zip(color_idx_list, ki_list):
+        # get minimum points as indices
+        color_sums = w_sums.take(color_sums_ind)
+        arg_mins = np.argpartition(color_sums, ki - 1)[:ki]
+
+        min_indecies.append(color_sums_ind.take(arg_mins))
+        W += color_sums.take(arg_mins).sum()
+
+    return np.concatenate(min_indecies), W
+
+
+def count_within_range(points : npt.NDArray[np.float64], centers : npt.NDArray[np.float64], r : float,
+                       out=None, points_sq=None, chunk_size=4096) -> npt.NDArray[np.int64]:
+    """
+    Counts, for every point, how many centers lie within distance r of it (inclusive)
+    The set of centers is small (k points), so squared distances are computed a block of points at a time via
+        |p - c|^2 = |p|^2 - 2 p.c + |c|^2
+    letting the matrix product go through BLAS without ever holding the full distance matrix
+
+    :param points: the points to count around
+    :param centers: the (small) set of centers
+    :param r: radius
+    :param out: optional preallocated array (one entry per point) to write the counts into
+    :param points_sq: optional precomputed squared norms of points
+    :param chunk_size: number of points per block
+    :return: an array with one count per point
+    """
+    N = len(points)
+    if out is None:
+        out = np.empty(N, dtype=np.int64)
+    if points_sq is None:
+        points_sq = np.einsum('ij,ij->i', points, points)
+
+    centers_sq = np.einsum('ij,ij->i', centers, centers)
+    r2 = r * r
+
+    for start in range(0, N, chunk_size):
+        stop = min(start + chunk_size, N)
+
+        d2 = points[start:stop] @ centers.T
+        d2 *= -2.0
+        d2 += points_sq[start:stop, None]
+        d2 += centers_sq
+
+        np.sum(d2 <= r2, axis=1, out=out[start:stop])
+
+    return out
+
+
+class MWUScratch:
+    def __init__(self, features, colors, kis):
+        """
+        Holds everything the MWU method needs that does not depend on gamma, so it can be built once
+        and shared by every retry of the falloff loop
+
+        :param features: the data set
+        :param colors: color labels for the data set
+        :param kis: map of colors to requested counts
+        """
+        N = len(features)
+        k = sum(kis.values())
+
+        # per-color indices never change, so find them once up front
+        self.color_idx_list, self.ki_list = build_color_groups(colors, kis)
+
+        # the features never change, so neither do their squared norms
+        self.features_sq = np.einsum('ij,ij->i', features, features)
+
+        self.h = np.empty(N, dtype=np.double)                            # weights
+        self.X = np.empty(N)                                             # Output
+
+        # per-iteration scratch space (every entry is overwritten each round)
+        self.S = np.empty((k, features.shape[1]), dtype=features.dtype)  # points we select this round
+        self.M = np.empty(N, dtype=np.double)                            # update factors for h
+        self.Cs = np.empty(N, dtype=np.int64)                            # selected points in range per point
+        self.h32 = np.empty(N, dtype=np.float32)                         # h as sent to the query (shorter messages)
+        self.avg_prev = np.empty(N)                                      # earlier X / (t + 1), to check for convergence
+
+    def reset(self) -> None:
+        """
+        Resets the weights and output to their starting values for a new MWU run
+        :return: None
+        """
+        self.h.fill(1.0 / len(self.h))
+        self.X.fill(0)
+        self.avg_prev.fill(0)
+
+
+def mult_weight_core(gen, gamma, N, k, features, colors, c_tree : WeightedTree, kis, epsilon, query_fn, percent_theoretical_limit=1.0, convergence_tolerance=None, scratch=None):
+    """
+    uses the multiplicative weight update method to
+    generate an integer solution for the LP
+    (the variants only differ in how the weights of every point are queried, which is left to query_fn)
+    :param gen: RNG generator
+    :param gamma: the minimum distance to optimize for
+    :param N: the number of elements in the dataset
+    :param k: total number of points selected
+    :param features: dataset's features
+    :param colors: matching colors
+    :param c_tree: The ParGeo C++ tree on the features (used to check if X is feasible)
+    :param kis: the color->count mapping
+    :param epsilon: allowed error value
+    :param query_fn: called as query_fn(t, h, h32) with the iteration, the weights and a float32 copy of them;
+                     returns the weight sums around every point and the translation time spent getting them
+    :param percent_theoretical_limit: Percentage of the theoretical maximum number of iterations to run (default 1.0)
+    :param convergence_tolerance: every 50 iterations (after the first 100), compare the running average X / (t + 1) with its
+                                  value 50 iterations earlier; once the largest change is below convergence_tolerance, X is checked
+                                  for feasibility right away and the run stops if it is feasible (default None, never)
+    :param scratch: an MWUScratch for this problem, shared across calls that only change gamma (default None, build one)
+    :return: a length N vector X of the solution or None if infeasible
+    :return: the "removed time" for encoding and decoding
+    """
+
+    """
+        Things to try
+            - softmax
+            - sampling based on weights
+            - counting approximation approach (ask professor for writeup)
+            - random ideas?
+    """
+
+    def getNextSolutionCheckWait():
+        return gen.integers(9, 29)
+
+    nextSolutionCheckWait = getNextSolutionCheckWait()
+
+    assert(k > 0)
+
+    # time spent translating queries
+    translation_time = 0
+
+    scaled_eps = epsilon / (1.0 + (epsilon / 4.0))
+
+    # for calculating error
+    mu = k - 1
+
+    if scratch is None:
+        scratch = MWUScratch(features, colors, kis)
+    scratch.reset()
+
+    h = scratch.h
+    X = scratch.X
+
+    # iterations, scaled by the amount of the theoretical limit requested
+    T = math.ceil(((8.0 * mu) / (scaled_eps * scaled_eps)) * math.log(N) * percent_theoretical_limit)
+
+    # X / (t + 1) is feasible when no weighted ball exceeds this
+    feasible_bound = 1.0 + epsilon
+
+    # gamma-independent data and scratch space shared with previous runs
+    color_idx_list, ki_list = scratch.color_idx_list, scratch.ki_list
+    features_sq = scratch.features_sq
+    S, M, Cs, h32 = scratch.S, scratch.M, scratch.Cs, scratch.h32
+    avg_prev = scratch.avg_prev    # X / (t + 1) at the end of the last convergence window
+
+    # iterations per convergence window
+    convergence_window = 50
+
+    for t in trange(T, desc='MWU Loop', disable=False):
+
+        # weights to every point (time is ignored for now)
+        np.copyto(h32, h, casting='same_kind')
+        w_sums, query_translation_time = query_fn(t, h, h32)
+        translation_time += query_translation_time
+
+        # compute minimums per color
+        min_indecies, W = min_weight_per_color(w_sums, color_idx_list, ki_list)
+
+        # add 1 to X[i]'s that are the minimum indices (add.at so repeated indices are all counted)
+        np.add.at(X, min_indecies, 1)
+        # add points we've seen to S
+        np.take(features, min_indecies, axis=0, out=S)
+
+        if W >= 1:
+            # struct.delete_tree()
+            return None, translation_time
+
+        # get counts of selected points within range of every point
+        count_within_range(features, S, gamma / 2.0, out=Cs, points_sq=features_sq)
+
+        # update H (in place)
+        mwu_update_weights(h, Cs, scaled_eps, mu, scratch=M)
+
+        # once the running average X / (t + 1) has (l-inf) stopped moving between windows,
+        # check feasibility right away rather than waiting for the next random check
+        converged = False
+        if convergence_tolerance is not None and (t + 1) % convergence_window == 0:
+            np.divide(X, t + 1, out=M)
+            converged = t > 100 and np.abs(M - avg_prev).max() < convergence_tolerance
+            np.copyto(avg_prev, M)
+
+        # check directly if X is a feasible solution
+        if t > 100 and (nextSolutionCheckWait == 0 or converged):
+            # reset the wait to a new time
+            nextSolutionCheckWait = getNextSolutionCheckWait()
+
+            timer = algsU.Stopwatch("Query")
+
+            # the query is linear in the weights, so scale the bound by (t + 1) rather than dividing X
+            inner_time, X_weights = c_tree.run_query(gamma / 2.0, X)
+            _, outer_time = timer.stop()
+            translation_time += (outer_time - inner_time)
+
+            if not np.any(X_weights > feasible_bound * (t + 1)):
+                break
+        else:
+            nextSolutionCheckWait -= 1
+
+    # t is always bound, unless we run for 0 iterations, which is an error
+    X = X / (t + 1)
+    return X, translation_time
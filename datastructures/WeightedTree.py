@@ -40,6 +40,19 @@ class WeightedTree:
         response_str = response_str[:-1]  # strip the newline
         return json.loads(response_str)
 
+    @staticmethod
+    def _encode_weights(weights: np.ndarray):
+        """
+        "Private method" that encodes a weight vector as a JSON array string.
+        float32 weights are written with 9 significant digits (enough to round trip a float32), which keeps
+        the message a good deal shorter than the 17 digits json uses for float64 values.
+        :param weights: a np array of weights
+        :return: the JSON array string
+        """
+        if weights.dtype == np.float32:
+            return '[' + ','.join(['%.9g' % w for w in weights.ravel().tolist()]) + ']'
+        return json.dumps(weights.ravel().tolist())
+
     def construct_tree(self, points: np.ndarray):
         """
         creates a data structure with the given points, returns the time taken to do the action
@@ -64,17 +77,17 @@ class WeightedTree:
         """
         creates a json message for the data structure to run a radius query with the given weights and radius.
         :param radius: The radius for the query
-        :param weights: a np array of weights
+        :param weights: a np array of weights (float32 weights are sent at float32 precision)
         :return: a tuple of the time recorded to perform the action and an np array of weights.
         """
-        assert (self.N == len(weights.flatten()))
+        assert (self.N == weights.size)
 
         message_json = {
             "type": "run-query",
-            "radius": radius,
-            "weights": weights.flatten().tolist()}
+            "radius": radius}
 
-        message_str = json.dumps(message_json)
+        # splice the weights in ourselves so float32 weights can be sent at float32 precision
+        message_str = json.dumps(message_json)[:-1] + ', "weights": ' + self._encode_weights(weights) + '}'
 
         response_json = self._send_message(message_str)
         # TODO: check response and handle if errors occurred
@@ -86,20 +99,20 @@ class WeightedTree:
         """
         Similar to run_query but allows to specify the points we wish to query directly
         :param radius: The radius for the query
-        :param weights: a np array of weights (one for each point in the ENTIRE dataset)
+        :param weights: a np array of weights (one for each point in the ENTIRE dataset, float32 is sent at float32 precision)
         :param indices: the indices of points in the dataset which we want to query
         :return: a tuple of the time recorded to perform the action and an np array of weights.
         """
-        assert (self.N == len(weights.flatten()))
+        assert (self.N == weights.size)
 
         message_json = {
             "type": "run-query",
             "radius": radius,
-            "weights": weights.flatten().tolist(),
             "indices": indices.flatten().tolist(),
         }
 
-        message_str = json.dumps(message_json)
+        # splice the weights in ourselves so float32 weights can be sent at float32 precision
+        message_str = json.dumps(message_json)[:-1] + ', "weights": ' + self._encode_weights(weights) + '}'
 
         response_json = self._send_message(message_str)
         # TODO: check response and handle if errors occurred
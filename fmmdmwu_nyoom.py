@@ -1,17 +1,15 @@
 
-import math
 import numpy as np
-from tqdm import trange
 import sys
 
 from datastructures.WeightedTree import WeightedTree
-import datastructures.BallTree as BallTree
 from algorithms.rounding import rand_round
 import algorithms.utils as algsU
+import algorithms.mwu as MWU
 import datasets.utils as datsU
 import algorithms.coreset as CORESET
 
-def mult_weight_upd(gen, gamma, N, k, features, colors, c_tree : WeightedTree, kis, epsilon, percent_theoretical_limit=1.0):
+def mult_weight_upd(gen, gamma, N, k, features, colors, c_tree : WeightedTree, kis, epsilon, percent_theoretical_limit=1.0, convergence_tolerance=None, scratch=None):
     """
     uses the multiplicative weight update method to
     generate an integer solution for the LP
@@ -24,110 +22,25 @@ def mult_weight_upd(gen, gamma, N, k, features, colors, c_tree : WeightedTree, k
     :param kis: the color->count mapping
     :param epsilon: allowed error value
     :param percent_theoretical_limit: Percentage of the theoretical maximum number of iterations to run (default 1.0)
-    :return: a nx1 vector X of the solution or None if infeasible
+    :param convergence_tolerance: every 50 iterations (after the first 100), compare the running average X / (t + 1) with its
+                                  value 50 iterations earlier; once the largest change is below convergence_tolerance, X is checked
+                                  for feasibility right away and the run stops if it is feasible (default None, never)
+    :param scratch: an MWU.MWUScratch for this problem, shared across calls that only change gamma (default None, build one)
+    :return: a length N vector X of the solution or None if infeasible
     :return: the "removed time" for encoding and decoding
     """
 
-    """
-        Things to try
-            - softmax
-            - sampling based on weights
-            - counting approximation approach (ask professor for writeup)
-            - random ideas?
-    """
-
-    def getNextSolutionCheckWait():
-        return gen.integers(9, 29)
-
-    nextSolutionCheckWait = getNextSolutionCheckWait()
-
-    assert(k > 0)
-
-    # time spent translating queries
-    translation_time = 0
-
-    scaled_eps = epsilon / (1.0 + (epsilon / 4.0))
-
-    # for calculating error
-    mu = k - 1
-
-    h = np.full((N, 1), 1.0 / N, dtype=np.double) # weights
-    X = np.zeros((N, 1))         # Output
-
-    T = ((8 * mu) / (math.pow(scaled_eps, 2))) * math.log(N, math.e) # iterations
-    # scale by the amount of the theoretical limit requested
-    T *= percent_theoretical_limit
-
-    for t in trange(math.ceil(T), desc='MWU Loop', disable=False):
-        S = np.empty((0, features.shape[1]))  # points we select this round
-        W = 0                                 # current weight sum
-
-        # weights to every point (time is ignored for now)
+    def query(t, h, h32):
         timer = algsU.Stopwatch("Query")
-        inner_time, w_sums = c_tree.run_query(gamma / 2.0, h)
+        inner_time, w_sums = c_tree.run_query(gamma / 2.0, h32)
         _, outer_time = timer.stop()
-        translation_time += (outer_time - inner_time)
-
-        # compute minimums per color
-        # TODO pre-compute as much of this loop as possible
-        for color in kis.keys():
-            # need this to reverse things
-            color_sums_ind = (color == colors).nonzero()[0] # tuple for reasons
+        return w_sums, outer_time - inner_time
 
-            # get minimum points as indices
-            color_sums = w_sums[color_sums_ind]
-            partition = np.argpartition(color_sums, kis[color] - 1)
-            arg_mins = partition[:kis[color]]
-            min_indecies = color_sums_ind[arg_mins]
+    return MWU.mult_weight_core(gen, gamma, N, k, features, colors, c_tree, kis, epsilon, query,
+                                percent_theoretical_limit, convergence_tolerance, scratch)
 
-            # add 1 to X[i]'s that are the minimum indices
-            X[min_indecies] += 1
-            # add points we've seen to S
-            S = np.append(S, features[min_indecies], axis=0)
-            # add additional weight to W
-            W += np.sum(w_sums[min_indecies])
 
-        if W >= 1:
-            # struct.delete_tree()
-            return None, translation_time
-
-        # get counts of points in each ball in M
-        M = np.zeros_like(h)
-        Z = BallTree.create(S)
-
-        Cs = BallTree.get_counts_in_range(Z, features, gamma / 2.0)
-        for i, c in enumerate(Cs):
-            M[i] = (1.0 / mu) * ((-1 * c) + 1)
-
-        # update H
-        h = h * (np.ones_like(M) - ((scaled_eps / 4.0) * M))
-
-        h /= np.sum(h)
-
-        # TODO: check rate of change of X and h (euclidean distance) or l-inf
-
-        # check directly if X is a feasible solution
-        if t > 100 and nextSolutionCheckWait == 0:
-            # reset the wait to a new time
-            nextSolutionCheckWait = getNextSolutionCheckWait()
-
-            timer = algsU.Stopwatch("Query")
-
-            _, X_weights = c_tree.run_query(gamma / 2.0, (X / (t + 1)))
-            _, outer_time = timer.stop()
-            translation_time += (outer_time - inner_time)
-
-            if not np.any(X_weights > 1 + epsilon):
-                break
-        else:
-            nextSolutionCheckWait -= 1
-
-    # t is always bound, unless we run for 0 iterations, which is an error
-    X = X / (t + 1)
-    return X, translation_time
-
-
-def epsilon_falloff(gen, features, colors, kis, gamma_upper, mwu_epsilon, falloff_epsilon, return_unadjusted, percent_theoretical_limit=1.0):
+def epsilon_falloff(gen, features, colors, kis, gamma_upper, mwu_epsilon, falloff_epsilon, return_unadjusted, percent_theoretical_limit=1.0, convergence_tolerance=None):
     """
     starts at a high bound (given by the corset estimate) and repeatedly falls off by 1-epsilon
     :param gen: RNG generator
@@ -139,6 +52,9 @@ def epsilon_falloff(gen, features, colors, kis, gamma_upper, mwu_epsilon, fallof
     :param falloff_epsilon: epsilon for the falloff system (fraction to reduce by each cycle)
     :param return_unadjusted: whether to also return the "real" time
     :param percent_theoretical_limit: Percentage of the theoretical maximum number of iterations to run (default 1.0)
+    :param convergence_tolerance: every 50 iterations (after the first 100), compare the running average X / (t + 1) with its
+                                  value 50 iterations earlier; once the largest change is below convergence_tolerance, X is checked
+                                  for feasibility right away and the run stops if it is feasible (default None, never)
     :return:
     """
 
@@ -157,12 +73,15 @@ def epsilon_falloff(gen, features, colors, kis, gamma_upper, mwu_epsilon, fallof
     pargeo_tree = WeightedTree(dim)
     pargeo_tree.construct_tree(features)
 
-    X, cur_trans_time = mult_weight_upd(gen, gamma, N, k, features, colors, pargeo_tree, kis, mwu_epsilon, percent_theoretical_limit)
+    # everything in the MWU method that doesn't depend on gamma, reused across retries
+    scratch = MWU.MWUScratch(features, colors, kis)
+
+    X, cur_trans_time = mult_weight_upd(gen, gamma, N, k, features, colors, pargeo_tree, kis, mwu_epsilon, percent_theoretical_limit, convergence_tolerance, scratch)
     translation_time += cur_trans_time
 
     while X is None:
         gamma = gamma * (1 - falloff_epsilon)
-        X, cur_trans_time = mult_weight_upd(gen, gamma, N, k, features, colors, pargeo_tree, kis, mwu_epsilon, percent_theoretical_limit)
+        X, cur_trans_time = mult_weight_upd(gen, gamma, N, k, features, colors, pargeo_tree, kis, mwu_epsilon, percent_theoretical_limit, convergence_tolerance, scratch)
         translation_time += cur_trans_time
 
     # "clean up" our tree
@@ -170,8 +89,7 @@ def epsilon_falloff(gen, features, colors, kis, gamma_upper, mwu_epsilon, fallof
 
     timer.split("Randomized Rounding")
 
-    # we need to flatten X since it expects an array rather than a 1D vector
-    S = rand_round(gen, gamma / 2.0, X.flatten(), features, colors, kis)
+    S = rand_round(gen, gamma / 2.0, X, features, colors, kis)
 
     _, total_time = timer.stop()
 
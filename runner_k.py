@@ -98,6 +98,8 @@ algorithms = {
         mwu_epsilon = setup['algorithms'][name]['mwu_epsilon'],
         falloff_epsilon = setup['algorithms'][name]['falloff_epsilon'],
         percent_theoretical_limit = setup['algorithms'][name]['percent_theoretical_limit'],
+        # optional: check feasibility early once X / (t + 1) moves less than this between 50-iteration windows
+        convergence_tolerance = setup['algorithms'][name].get('convergence_tolerance'),
         return_unadjusted = False
     ),
     'FMMD-LP' : lambda gen, name, kis, kwargs : FMMDLP(
@@ -119,6 +121,8 @@ algorithms = {
         return_unadjusted=False,
         sample_percentage=setup['algorithms'][name]['sample_percentage'],
         percent_theoretical_limit=setup['algorithms'][name]['percent_theoretical_limit'],
+        # optional: check feasibility early once X / (t + 1) moves less than this between 50-iteration windows
+        convergence_tolerance=setup['algorithms'][name].get('convergence_tolerance'),
     ),
 }
 